@@ -0,0 +1,239 @@
+import atexit
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.response import Response
+
+COUNTS_NAMESPACE = 'counts'
+RECIPES_NAMESPACE = 'recipes'
+TAGS_NAMESPACE = 'tags'
+INGREDIENTS_NAMESPACE = 'ingredients'
+
+# Данные в памяти процесса, которые нужно перепроверить после bump_version.
+LOCAL_STATES = []
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_version(namespace):
+    """
+    Возвращает текущую версию пространства имён кэша.
+
+    Начальная версия берётся из текущего времени, поэтому после вытеснения
+    ключа из кэша версии не повторяются и старые записи не оживают.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(namespaces):
+    """Возвращает версии нескольких пространств имён за одно обращение."""
+    keys = {namespace: _version_key(namespace) for namespace in namespaces}
+    found = cache.get_many(keys.values())
+    return {
+        namespace: found[key] if key in found else get_version(namespace)
+        for namespace, key in keys.items()
+    }
+
+
+def bump_version(*namespaces):
+    """
+    Инвалидирует записи пространств имён сменой их версии.
+
+    Версия записывается заново без срока жизни: incr на части бэкендов
+    реализован как get и set с таймаутом по умолчанию, и версия истекала
+    бы вместе со всеми записями пространства.
+    """
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        current = cache.get(key) or 0
+        cache.set(key, max(current + 1, time.time_ns()), timeout=None)
+    for state in LOCAL_STATES:
+        if state.namespace in namespaces:
+            state.checked_at = None
+
+
+def make_key(namespace, *parts):
+    """Собирает ключ кэша с учётом версии пространства имён."""
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+    return f'{namespace}:{get_version(namespace)}:{digest}'
+
+
+def recipe_namespace(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def normalize_query(request):
+    """Возвращает параметры запроса в независимом от порядка виде."""
+    return tuple(sorted(
+        (key, tuple(sorted(values)))
+        for key, values in request.query_params.lists()
+    ))
+
+
+class StatsBuffer:
+    """
+    Счётчики попаданий и промахов в памяти процесса.
+
+    Накопленные значения переносятся в общий кэш не чаще раза в
+    CACHE_STATS_FLUSH_INTERVAL секунд, поэтому подсчёт не добавляет
+    обращений к кэшу на каждый запрос.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, key):
+        now = time.monotonic()
+        with self.lock:
+            self.pending[key] += 1
+            if now - self.flushed_at < settings.CACHE_STATS_FLUSH_INTERVAL:
+                return
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = now
+        self.write(pending)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        self.write(pending)
+
+    def write(self, pending):
+        for key, count in pending.items():
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, count)
+
+
+stats_buffer = StatsBuffer()
+atexit.register(stats_buffer.flush)
+
+
+def record_stat(name, event):
+    """Учитывает попадание или промах кэша."""
+    stats_buffer.add(f'stats:{name}:{event}')
+
+
+def get_stats(name):
+    return {
+        event: cache.get(f'stats:{name}:{event}', 0)
+        for event in ('hits', 'misses')
+    }
+
+
+def reset_stats(name):
+    cache.delete_many([f'stats:{name}:hits', f'stats:{name}:misses'])
+
+
+def cached_response(name, key, build_response):
+    """
+    Возвращает ответ из кэша или строит его и сохраняет данные.
+
+    Кэшируются сериализованные данные, а не байты, поэтому выбор формата
+    ответа по-прежнему выполняет DRF.
+    """
+    data = cache.get(key)
+    if data is not None:
+        record_stat(name, 'hits')
+        return Response(data)
+    record_stat(name, 'misses')
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+class LocalPayload:
+    """Сериализованные данные и их хэш для ETag."""
+
+    def __init__(self, data):
+        dumped = json.dumps(
+            data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True
+        )
+        self.data = json.loads(dumped)
+        self.digest = hashlib.md5(dumped.encode()).hexdigest()
+
+
+class VersionedState:
+    """
+    Данные в памяти процесса, привязанные к версии пространства имён.
+
+    Версия читается из общего кэша не чаще раза в
+    LOCAL_CACHE_CHECK_INTERVAL секунд, между проверками данные отдаются
+    из памяти без обращений к кэшу. bump_version в этом же процессе
+    сбрасывает интервал, поэтому свои изменения видны сразу, а изменения
+    других процессов — после очередной проверки. Если кэш не общий для
+    процессов, данные всё равно перечитываются не реже раза в
+    LOCAL_CACHE_MAX_AGE секунд.
+    """
+
+    namespace = None
+
+    def __init__(self):
+        self.version = None
+        self.expires_at = 0
+        self.checked_at = None
+        LOCAL_STATES.append(self)
+
+    def sync(self):
+        now = time.monotonic()
+        if (
+            self.checked_at is not None
+            and now - self.checked_at < settings.LOCAL_CACHE_CHECK_INTERVAL
+        ):
+            return
+        self.checked_at = now
+        version = get_version(self.namespace)
+        if version != self.version or now >= self.expires_at:
+            self.reload()
+            self.version = version
+            self.expires_at = now + settings.LOCAL_CACHE_MAX_AGE
+
+    def reload(self):
+        raise NotImplementedError
+
+
+class LocalCache(VersionedState):
+    """Кэш сериализованных данных в памяти процесса."""
+
+    def __init__(self, namespace, max_entries=256):
+        super().__init__()
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def reload(self):
+        self.entries.clear()
+
+    def get(self, key):
+        self.sync()
+        payload = self.entries.get(key)
+        if payload is not None:
+            self.entries.move_to_end(key)
+        return payload
+
+    def set(self, key, data):
+        payload = LocalPayload(data)
+        self.entries[key] = payload
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return payload
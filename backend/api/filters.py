@@ -1,20 +1,66 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Recipe
+
+from .search import tag_map
+
+
+class TagSlugsFilter(filters.MultipleChoiceFilter):
+    """
+    Фильтр по слагам тегов.
+
+    Допустимые значения берутся из закэшированного соответствия слагов и
+    id, поэтому для построения вариантов не нужен запрос SELECT DISTINCT.
+    """
+
+    @property
+    def field(self):
+        self.extra['choices'] = [(slug, slug) for slug in tag_map.get()]
+        return super().field
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр для рецептов."""
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagSlugsFilter(method='filter_tags')
     author = filters.NumberFilter(field_name='author__id')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Фильтрация по тегам через EXISTS без JOIN, который дублирует
+        рецепты с несколькими подходящими тегами.
+
+        Тег может быть удалён после проверки значения, поэтому
+        отсутствующие в карте слаги пропускаются.
+        """
+        ids_by_slug = tag_map.get()
+        tag_ids = [
+            ids_by_slug[slug] for slug in value if slug in ids_by_slug
+        ]
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=tag_ids
+            )
+        ))
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрация по наличию рецепта в избранном."""
@@ -30,12 +76,32 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shoppingcart_by__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию и описанию.
 
-class IngredientFilter(filters.FilterSet):
-    """Фильтр для поиска ингредиентов."""
+        Совпадения ищутся по поисковому вектору (русская конфигурация) и по
+        триграммному сходству названия, что прощает опечатки. Релевантность
+        сохраняется в search_rank.
+        """
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).annotate(
+            search_rank=(
+                SearchRank(F('search_vector'), query)
+                + TrigramSimilarity('name', value)
+            )
+        )
 
-    name = filters.CharFilter(field_name='name', lookup_expr='startswith')
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов; при поиске по умолчанию — по релевантности."""
+
+    def get_ordering(self, request, queryset, view):
+        if (
+            not request.query_params.get(self.ordering_param)
+            and 'search_rank' in queryset.query.annotations
+        ):
+            return ('-search_rank', '-pub_date', '-id')
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+from .cache import TAGS_NAMESPACE, get_versions, recipe_namespace
+from .serializers import RecipeSerializer
+
+
+def get_fragment_keys(recipe_ids, request):
+    """Возвращает ключи фрагментов с учётом версий рецептов и тегов."""
+    namespaces = {
+        recipe_id: recipe_namespace(recipe_id) for recipe_id in recipe_ids
+    }
+    versions = get_versions([TAGS_NAMESPACE, *namespaces.values()])
+    host = request.build_absolute_uri('/')
+    return {
+        recipe_id: (
+            f'recipe-fragment:{recipe_id}:{versions[namespace]}:'
+            f'{versions[TAGS_NAMESPACE]}:{host}'
+        )
+        for recipe_id, namespace in namespaces.items()
+    }
+
+
+def load_fragments(recipe_ids, context):
+    """
+    Сериализует рецепты без пользовательских признаков.
+
+    Признаки подписки, избранного и списка покупок в результате всегда
+    ложны и заменяются в render_recipes для конкретного пользователя.
+    """
+    recipes = Recipe.objects.filter(id__in=recipe_ids).select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )
+    )
+    context = {**context, 'subscribed_ids': frozenset()}
+    data = RecipeSerializer(recipes, many=True, context=context).data
+    return {item['id']: item for item in data}
+
+
+def render_recipes(recipes, context):
+    """
+    Возвращает представления рецептов из кэша фрагментов.
+
+    Общая для всех пользователей часть рецепта хранится в кэше по id и
+    версии рецепта. Признаки is_favorited, is_in_shopping_cart и
+    author.is_subscribed берутся из аннотаций рецептов, загруженных
+    одним запросом страницы.
+    """
+    recipes = list(recipes)
+    keys = get_fragment_keys([recipe.id for recipe in recipes],
+                             context['request'])
+    cached = cache.get_many(keys.values())
+    fragments = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items() if key in cached
+    }
+
+    missing = [recipe_id for recipe_id in keys if recipe_id not in fragments]
+    if missing:
+        loaded = load_fragments(missing, context)
+        cache.set_many(
+            {keys[recipe_id]: data for recipe_id, data in loaded.items()},
+            timeout=settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+        )
+        fragments.update(loaded)
+
+    results = []
+    for recipe in recipes:
+        data = fragments.get(recipe.id)
+        if data is None:
+            # Рецепт удалён после загрузки страницы.
+            continue
+        data['is_favorited'] = getattr(recipe, 'is_favorited', False)
+        data['is_in_shopping_cart'] = getattr(
+            recipe, 'is_in_shopping_cart', False
+        )
+        data['author']['is_subscribed'] = getattr(
+            recipe, 'is_author_subscribed', False
+        )
+        results.append(data)
+    return results
@@ -0,0 +1,199 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.images import build_variants, variant_files
+from jobs.queue import enqueue, task
+from recipes.models import Recipe
+from users.models import User
+
+from .signals import touch_recipes
+
+IMAGE_FIELDS = {
+    Recipe: ('image', 'image_variants'),
+    User: ('avatar', 'avatar_variants'),
+}
+
+
+def needs_variants(instance):
+    """Проверяет, устарели ли варианты изображения объекта."""
+    image_field, variants_field = IMAGE_FIELDS[type(instance)]
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field)
+    if not image:
+        return bool(variants)
+    return variants.get('source') != image.name
+
+
+def schedule_variants(instance):
+    """Ставит построение вариантов изображения в очередь задач."""
+    if needs_variants(instance):
+        enqueue(
+            'images.generate_variants',
+            model=instance._meta.label,
+            pk=instance.pk
+        )
+
+
+def is_referenced(name):
+    """
+    Проверяет, ссылается ли на файл изображение или вариант объекта.
+
+    Варианты ищутся по текстовому представлению JSON без индекса, поэтому
+    функция предназначена для фоновых задач.
+    """
+    for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+        referenced = model.objects.annotate(
+            variants_text=Cast(variants_field, TextField())
+        ).filter(
+            Q(**{image_field: name}) | Q(variants_text__contains=f'"{name}"')
+        ).exists()
+        if referenced:
+            return True
+    return False
+
+
+def release_files(names, storage=default_storage):
+    """
+    Удаляет файлы, на которые больше не ссылается ни один объект.
+
+    Хранилище объединяет одинаковые загрузки, поэтому файл удаляется
+    только после проверки ссылок. Файлы, записанные или повторно
+    загруженные за последние MEDIA_RELEASE_GRACE секунд, не трогаются:
+    ссылка на них может быть ещё не сохранена. Возвращает имена
+    удалённых файлов.
+    """
+    threshold = timezone.now() - timedelta(
+        seconds=settings.MEDIA_RELEASE_GRACE
+    )
+    deleted = []
+    for name in dict.fromkeys(filter(None, names)):
+        if not storage.exists(name) or is_referenced(name):
+            continue
+        if storage.get_modified_time(name) > threshold:
+            continue
+        storage.delete(name)
+        deleted.append(name)
+    return deleted
+
+
+def schedule_release(names):
+    """Ставит освобождение файлов в очередь задач."""
+    names = list(dict.fromkeys(filter(None, names)))
+    if names:
+        enqueue('media.release', names=names)
+
+
+@task('media.release')
+def release_files_job(names):
+    release_files(names)
+
+
+@task('images.generate_variants')
+def generate_variants_job(model, pk):
+    generate_variants(apps.get_model(model), pk)
+
+
+def generate_variants(model, pk, force=False):
+    """
+    Строит варианты текущего изображения объекта и сохраняет их имена.
+
+    Поле обновляется только если изображение не сменилось за время
+    обработки; иначе созданные файлы освобождаются. При смене
+    изображения освобождаются старые варианты и прежний исходник.
+    Возвращает True, если варианты изменились.
+    """
+    image_field, variants_field = IMAGE_FIELDS[model]
+    obj = model.objects.filter(pk=pk).only(
+        image_field, variants_field
+    ).first()
+    if obj is None or not (force or needs_variants(obj)):
+        return False
+
+    image = getattr(obj, image_field)
+    old_variants = getattr(obj, variants_field)
+    if image:
+        variants = build_variants(image)
+        same_image = Q(**{image_field: image.name})
+    else:
+        variants = {}
+        same_image = (
+            Q(**{f'{image_field}__isnull': True}) | Q(**{image_field: ''})
+        )
+    updated = model.objects.filter(same_image, pk=pk).update(
+        **{variants_field: variants}
+    )
+    if not updated:
+        release_files(variant_files(variants))
+        return False
+
+    if old_variants.get('source') != variants.get('source'):
+        release_files(
+            variant_files(old_variants) + [old_variants.get('source')]
+        )
+    if model is Recipe:
+        touch_recipes(Recipe.objects.filter(pk=pk))
+    else:
+        touch_recipes(Recipe.objects.filter(author_id=pk))
+    return True
+
+
+def get_previous_image(instance):
+    """Возвращает имя изображения объекта, сохранённое сейчас в БД."""
+    image_field, _ = IMAGE_FIELDS[type(instance)]
+    loaded = instance.get_loaded_values()
+    if image_field in loaded:
+        return loaded[image_field]
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        image_field, flat=True
+    ).first()
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def image_saving(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Запоминает прежнее изображение, чтобы освободить его после замены."""
+    image_field, _ = IMAGE_FIELDS[sender]
+    if (
+        raw or instance._state.adding
+        or (update_fields is not None and image_field not in update_fields)
+    ):
+        return
+    instance._previous_image = get_previous_image(instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    """
+    Ставит в очередь построение вариантов и освобождение прежнего файла.
+
+    Прежний файл освобождается сразу, а не после построения вариантов:
+    изображение могут заменить или удалить раньше, чем задача успеет
+    выполниться.
+    """
+    image_field, _ = IMAGE_FIELDS[sender]
+    previous = instance.__dict__.pop('_previous_image', None)
+    if raw or (update_fields is not None and image_field not in update_fields):
+        return
+    if previous and previous != getattr(instance, image_field).name:
+        schedule_release([previous])
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_owner_deleted(sender, instance, **kwargs):
+    image_field, variants_field = IMAGE_FIELDS[sender]
+    variants = getattr(instance, variants_field)
+    schedule_release(
+        [getattr(instance, image_field).name, variants.get('source')]
+        + variant_files(variants)
+    )
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from api.cache import get_stats, reset_stats
+
+CACHE_NAMES = ('recipes',)
+
+
+class Command(BaseCommand):
+    """Команда для вывода статистики попаданий в кэш ответов."""
+
+    help = 'Показывает число попаданий и промахов кэша ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        for name in CACHE_NAMES:
+            stats = get_stats(name)
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(
+                f'{name}: попаданий {stats["hits"]}, '
+                f'промахов {stats["misses"]}, доля попаданий {ratio:.1%}'
+            )
+            if options['reset']:
+                reset_stats(name)
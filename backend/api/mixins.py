@@ -1,37 +1,110 @@
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import Recipe
+from recipes.models import Recipe, ShoppingCart, ShoppingListItem
 from users.models import User
 
+from .cache import normalize_query
+from .serializers import BulkIdsSerializer
+from .signals import invalidate_counts, update_relation_counter
 
-def create_relation(request, obj_id, model_class, serializer_class, obj_model,
+
+def update_shopping_list(model_class, user_id, recipe_ids, delta):
+    """Обновляет агрегат списка покупок при изменении корзины."""
+    if model_class is not ShoppingCart or not recipe_ids:
+        return
+    if delta > 0:
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids)
+    else:
+        ShoppingListItem.objects.remove_recipes(user_id, recipe_ids)
+
+
+def insert_relations(model_class, user_field, obj_field, user_id, obj_ids):
+    """
+    Вставляет отношения одним запросом, пропуская уже существующие.
+
+    Возвращает id объектов, для которых отношение действительно создано.
+    Внешние ключи проверяются сразу, а не при фиксации транзакции, поэтому
+    отсутствующий объект приводит к IntegrityError на этом запросе.
+    """
+    table = model_class._meta.db_table
+    user_column = model_class._meta.get_field(user_field).column
+    obj_column = model_class._meta.get_field(obj_field).column
+    values = ', '.join(['(%s, %s)'] * len(obj_ids))
+    params = [value for obj_id in obj_ids for value in (user_id, obj_id)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SET CONSTRAINTS ALL IMMEDIATE; '
+            f'INSERT INTO {table} ({user_column}, {obj_column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING RETURNING {obj_column}',
+            params
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_relations(model_class, user_field, obj_field, user_id, obj_ids):
+    """
+    Удаляет отношения одним запросом.
+
+    Возвращает id объектов, для которых отношение действительно удалено.
+    Запрос идёт в обход сигналов, поэтому кэш количеств сбрасывает
+    вызывающий код.
+    """
+    table = model_class._meta.db_table
+    user_column = model_class._meta.get_field(user_field).column
+    obj_column = model_class._meta.get_field(obj_field).column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE {user_column} = %s AND {obj_column} = ANY(%s) '
+            f'RETURNING {obj_column}',
+            [user_id, list(obj_ids)]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_relation(request, obj_id, model_class, serializer_class,
                     user_field='user', obj_field='recipe', error_exists=None,
                     error_self=None, check_self=False):
     """Создаёт отношения между пользователем и объектом."""
     user = request.user
-    obj = get_object_or_404(obj_model, id=obj_id)
+    try:
+        obj_id = int(obj_id)
+    except (TypeError, ValueError):
+        raise Http404
 
-    if check_self and user == obj:
+    if check_self and obj_id == user.id:
         return Response(
             {
                 'error': error_self or 'Нельзя подписаться на себя'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    filter_kwargs = {user_field: user, obj_field: obj}
-    if model_class.objects.filter(**filter_kwargs).exists():
+    try:
+        with transaction.atomic():
+            created = insert_relations(
+                model_class, user_field, obj_field, user.id, [obj_id]
+            )
+            update_relation_counter(model_class, created, 1)
+            update_shopping_list(model_class, user.id, created, 1)
+    except IntegrityError as error:
+        if getattr(error.__cause__, 'pgcode', None) == FOREIGN_KEY_VIOLATION:
+            raise Http404
+        raise
+
+    if not created:
         return Response(
             {'error': error_exists or 'Отношение уже существует'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    invalidate_counts()
 
-    data = {user_field: user.id, obj_field: obj.id}
-    serializer = serializer_class(data=data, context={'request': request})
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
-
+    instance = model_class(**{user_field: user, f'{obj_field}_id': obj_id})
+    serializer = serializer_class(instance, context={'request': request})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -39,9 +112,19 @@ def delete_relation(request, obj_id, model_class, user_field='user',
                     obj_field='recipe', error_not_found=None):
     """Удаляет отношения пользователь - объект."""
     user = request.user
+    try:
+        obj_id = int(obj_id)
+    except (TypeError, ValueError):
+        raise Http404
 
-    filter_kwargs = {user_field: user, f'{obj_field}_id': obj_id}
-    deleted, _ = model_class.objects.filter(**filter_kwargs).delete()
+    with transaction.atomic():
+        deleted = delete_relations(
+            model_class, user_field, obj_field, user.id, [obj_id]
+        )
+        if deleted:
+            update_relation_counter(model_class, deleted, -1)
+            update_shopping_list(model_class, user.id, deleted, -1)
+            invalidate_counts()
 
     if not deleted:
         return Response(
@@ -52,6 +135,103 @@ def delete_relation(request, obj_id, model_class, user_field='user',
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def get_bulk_ids(request):
+    """Возвращает уникальные id из тела запроса в исходном порядке."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def bulk_response(ids, statuses):
+    return Response({
+        'results': [
+            {'id': obj_id, 'status': statuses[obj_id]} for obj_id in ids
+        ]
+    })
+
+
+def bulk_create_relations(request, model_class, obj_model, user_field='user',
+                          obj_field='recipe', check_self=False):
+    """
+    Создаёт отношения пользователя с несколькими объектами сразу.
+
+    Отношения вставляются одним запросом; для каждого id в ответе
+    указывается статус: created, exists, not_found или self.
+    """
+    user = request.user
+    ids = get_bulk_ids(request)
+    found = set(ids)
+    created_ids = []
+    while True:
+        found &= set(
+            obj_model.objects.filter(id__in=found).values_list('id', flat=True)
+        )
+        candidates = [
+            obj_id for obj_id in ids
+            if obj_id in found and not (check_self and obj_id == user.id)
+        ]
+        if not candidates:
+            break
+        try:
+            with transaction.atomic():
+                created_ids = insert_relations(
+                    model_class, user_field, obj_field, user.id, candidates
+                )
+                update_relation_counter(model_class, created_ids, 1)
+                update_shopping_list(model_class, user.id, created_ids, 1)
+        except IntegrityError as error:
+            # Объект удалён между проверкой и вставкой: перечитываем
+            # существующие id и повторяем вставку без него.
+            pgcode = getattr(error.__cause__, 'pgcode', None)
+            if pgcode != FOREIGN_KEY_VIOLATION:
+                raise
+            continue
+        break
+    if created_ids:
+        invalidate_counts()
+
+    created_ids = set(created_ids)
+    statuses = {}
+    for obj_id in ids:
+        if obj_id not in found:
+            statuses[obj_id] = 'not_found'
+        elif check_self and obj_id == user.id:
+            statuses[obj_id] = 'self'
+        elif obj_id in created_ids:
+            statuses[obj_id] = 'created'
+        else:
+            statuses[obj_id] = 'exists'
+
+    return bulk_response(ids, statuses)
+
+
+def bulk_delete_relations(request, model_class, user_field='user',
+                          obj_field='recipe'):
+    """
+    Удаляет отношения пользователя с несколькими объектами сразу.
+
+    Для каждого id в ответе указывается статус deleted или not_found.
+    """
+    user = request.user
+    ids = get_bulk_ids(request)
+
+    with transaction.atomic():
+        deleted_ids = delete_relations(
+            model_class, user_field, obj_field, user.id, ids
+        )
+        if deleted_ids:
+            update_relation_counter(model_class, deleted_ids, -1)
+            update_shopping_list(model_class, user.id, deleted_ids, -1)
+            invalidate_counts()
+
+    deleted_ids = set(deleted_ids)
+    statuses = {
+        obj_id: 'deleted' if obj_id in deleted_ids else 'not_found'
+        for obj_id in ids
+    }
+    return bulk_response(ids, statuses)
+
+
 class CollectionActionMixin:
     """Миксин для действий с коллекциями рецептов."""
 
@@ -65,7 +245,6 @@ class CollectionActionMixin:
                 obj_id=pk,
                 model_class=model_class,
                 serializer_class=serializer_class,
-                obj_model=Recipe,
                 error_exists=error_exists
             )
         elif request.method == 'DELETE':
@@ -76,6 +255,20 @@ class CollectionActionMixin:
                 error_not_found=error_not_found
             )
 
+    def handle_bulk_collection_action(self, request, model_class):
+        """Добавляет или удаляет несколько рецептов в коллекции."""
+        if request.method == 'POST':
+            return bulk_create_relations(
+                request=request,
+                model_class=model_class,
+                obj_model=Recipe
+            )
+        elif request.method == 'DELETE':
+            return bulk_delete_relations(
+                request=request,
+                model_class=model_class
+            )
+
 
 class SubscriptionActionMixin:
     """Миксин для действий с подписками на авторов."""
@@ -89,7 +282,6 @@ class SubscriptionActionMixin:
                 obj_id=user_id,
                 model_class=model_class,
                 serializer_class=serializer_class,
-                obj_model=User,
                 user_field='user',
                 obj_field='author',
                 error_exists='Вы уже подписаны на этого автора',
@@ -105,3 +297,65 @@ class SubscriptionActionMixin:
                 obj_field='author',
                 error_not_found='Вы не подписаны на этого автора'
             )
+
+    def handle_bulk_subscription_action(self, request, model_class):
+        """Подписывает или отписывает от нескольких авторов."""
+        if request.method == 'POST':
+            return bulk_create_relations(
+                request=request,
+                model_class=model_class,
+                obj_model=User,
+                obj_field='author',
+                check_self=True
+            )
+        elif request.method == 'DELETE':
+            return bulk_delete_relations(
+                request=request,
+                model_class=model_class,
+                obj_field='author'
+            )
+
+
+class LocalCacheMixin:
+    """
+    Миксин для почти неизменяемых справочников.
+
+    Ответы list/retrieve хранятся в памяти процесса (атрибут local_cache)
+    и отдаются со строгим ETag; при совпадении If-None-Match возвращается
+    304 без тела.
+    """
+
+    local_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            ('list', normalize_query(request)),
+            lambda: super(LocalCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.get_cached_response(
+            ('detail', lookup),
+            lambda: super(LocalCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def get_cached_response(self, key, build_response):
+        payload = self.local_cache.get(key)
+        if payload is None:
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            payload = self.local_cache.set(key, response.data)
+
+        request = self.request
+        etag = f'"{payload.digest}-{request.accepted_renderer.format}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(payload.data)
+        response['ETag'] = etag
+        return response
@@ -1,5 +1,183 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import COUNTS_NAMESPACE, make_key
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, кэширующий общее количество объектов.
+
+    Ключ строится по SQL запроса без сортировки и аннотаций, то есть по
+    нормализованному набору фильтров (включая фильтры по пользователю).
+    Кэш сбрасывается сигналами при изменении рецептов, избранного,
+    списков покупок и подписок. Для больших таблиц без фильтров можно
+    включить оценку количества по статистике планировщика PostgreSQL.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        count_queryset = queryset.order_by().values('pk')
+        try:
+            sql, params = count_queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = make_key(COUNTS_NAMESPACE, sql, params)
+        count = cache.get(key)
+        if count is None:
+            count = self.estimate_count()
+            if count is None:
+                count = count_queryset.count()
+            cache.set(
+                key, count, timeout=settings.PAGINATION_COUNT_CACHE_TIMEOUT
+            )
+        return count
+
+    def estimate_count(self):
+        """Возвращает оценку reltuples для таблицы без фильтров или None."""
+        threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if (
+            not threshold
+            or connection.vendor != 'postgresql'
+            or queryset.query.where
+            or queryset.query.distinct
+        ):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < threshold:
+            return None
+        return row[0]
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным режимом курсора.
+
+    По умолчанию работает как раньше (?page=&limit=). Если в запросе есть
+    параметр cursor (в том числе пустой — первая страница), выдача
+    строится по ключу из полей cursor_ordering представления без COUNT(*)
+    и OFFSET.
+    """
+
+    django_paginator_class = CachedCountPaginator
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pk',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        position = self.decode_cursor(request, len(ordering))
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(ordering, position)
+                )
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = results[-1]
+            self.next_position = [
+                getattr(last, field.lstrip('-')) for field in ordering
+            ]
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_keyset_filter(self, ordering, position):
+        """
+        Строит условие «строго после позиции» для упорядочивания ordering.
+
+        Нестрогая граница по первому полю дублирует условие, но позволяет
+        планировщику начать сканирование индекса сразу с нужной позиции.
+        """
+        first = ordering[0]
+        first_lookup = 'lte' if first.startswith('-') else 'gte'
+        bound = Q(**{f'{first.lstrip("-")}__{first_lookup}': position[0]})
+
+        after = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                condition &= Q(**{previous.lstrip('-'): value})
+            after |= condition
+        return bound & after
+
+    def decode_cursor(self, request, length):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != length:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        position = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in position
+        ]
+        data = json.dumps(position)
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def get_next_cursor_link(self):
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
@@ -0,0 +1,93 @@
+import csv
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+
+    Строки списка отдаются по одной через stream(), поэтому ответ можно
+    отправлять клиенту, не собирая его целиком в памяти. render()
+    используется только для ответов с ошибками и, как и остальной API,
+    возвращает JSON.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer = JSONRenderer()
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = renderer.media_type
+        return renderer.render(data, renderer_context=renderer_context)
+
+    def stream(self, items):
+        raise NotImplementedError
+
+    def get_filename(self):
+        return f'shopping_list.{self.format}'
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        yield 'Список покупок\n\n'
+        for item in items:
+            yield (
+                f'{item["name"]} ({item["measurement_unit"]}) '
+                f'— {item["amount"]}\n'
+            )
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['measurement_unit'], item['amount'])
+            )
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, items):
+        separator = ''
+        yield '['
+        for item in items:
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+
+class FormatParamNegotiation(DefaultContentNegotiation):
+    """
+    Выбирает рендерер только по параметру format.
+
+    Заголовок Accept не учитывается: без параметра используется первый
+    рендерер, как и до появления нескольких форматов.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        format = format_suffix or request.query_params.get(format_query_param)
+        if format:
+            renderers = self.filter_renderers(renderers, format)
+        return renderers[0], renderers[0].media_type
@@ -0,0 +1,84 @@
+from bisect import bisect_left
+
+from recipes.models import Ingredient, Tag
+
+from .cache import INGREDIENTS_NAMESPACE, TAGS_NAMESPACE, VersionedState
+
+
+class IngredientIndex(VersionedState):
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся в отсортированном списке в нижнем регистре: поиск
+    по префиксу — бинарный поиск, затем добираются совпадения по
+    подстроке. Индекс загружается при первом обращении и перестраивается,
+    когда меняется версия ингредиентов.
+    """
+
+    namespace = INGREDIENTS_NAMESPACE
+
+    def __init__(self):
+        super().__init__()
+        self.keys = []
+        self.items = []
+
+    def reload(self):
+        rows = sorted(
+            (name.casefold(), ingredient_id, name, measurement_unit)
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        )
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': row[1], 'name': row[2], 'measurement_unit': row[3]}
+            for row in rows
+        ]
+
+    def search(self, query, limit=None):
+        """
+        Возвращает ингредиенты, название которых начинается с query,
+        а за ними — содержащие query. Регистр не учитывается.
+        """
+        self.sync()
+        query = query.casefold()
+        keys = self.keys
+        results = []
+
+        index = bisect_left(keys, query)
+        prefix_start = index
+        while index < len(keys) and keys[index].startswith(query):
+            if limit is not None and len(results) >= limit:
+                return results
+            results.append(self.items[index])
+            index += 1
+        prefix_end = index
+
+        for index, key in enumerate(keys):
+            if limit is not None and len(results) >= limit:
+                break
+            if prefix_start <= index < prefix_end:
+                continue
+            if query in key:
+                results.append(self.items[index])
+        return results
+
+
+class TagMap(VersionedState):
+    """Соответствие слагов тегов их id в памяти процесса."""
+
+    namespace = TAGS_NAMESPACE
+
+    def __init__(self):
+        super().__init__()
+        self.ids_by_slug = {}
+
+    def reload(self):
+        self.ids_by_slug = dict(Tag.objects.values_list('slug', 'id'))
+
+    def get(self):
+        self.sync()
+        return self.ids_by_slug
+
+
+ingredient_index = IngredientIndex()
+tag_map = TagMap()
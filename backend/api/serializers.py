@@ -1,48 +1,207 @@
 import base64
-
-from django.core.files.base import ContentFile
+import binascii
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
+from django.db import transaction
+from PIL import Image
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from core.constants import (
+    IMAGE_DECODE_CHUNK_SIZE,
+    IMAGE_SIGNATURES,
+    IMAGE_VARIANT_SIZES,
+    MAX_BULK_IDS,
+    MAX_IMAGE_PIXELS,
+    MAX_IMAGE_SIZE,
+)
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Subscription, User
 
+from .utils import attach_author_recipes, get_recipes_limit, set_prefetched
+
+
+def check_missing_ids(ids, found, message):
+    """Сообщает обо всех id, которых нет среди найденных, одной ошибкой."""
+    missing = [obj_id for obj_id in ids if obj_id not in found]
+    if missing:
+        raise serializers.ValidationError(
+            f'{message}: {", ".join(map(str, missing))}'
+        )
+
+
+def detect_image_format(header):
+    """Возвращает расширение и MIME-тип по первым байтам файла или None."""
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp', 'image/webp'
+    for signature, extension, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension, content_type
+    return None
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для обработки изображений, закодированных в base64."""
+    """
+    Поле для обработки изображений, закодированных в base64.
+
+    Строка декодируется частями по IMAGE_DECODE_CHUNK_SIZE символов сразу
+    в загружаемый файл: небольшие изображения остаются в памяти, крупнее
+    FILE_UPLOAD_MAX_MEMORY_SIZE пишутся во временный файл на диске.
+    Размер проверяется до декодирования, формат — по первым байтам,
+    число пикселей — по заголовку изображения до его полной проверки.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные base64.',
+        'too_large': 'Размер изображения не должен превышать {max_size} МБ.',
+        'unsupported_format': (
+            'Поддерживаются изображения в форматах PNG, JPEG, GIF и WebP.'
+        ),
+        'too_many_pixels': (
+            'Изображение не должно содержать больше {max_pixels} пикселей.'
+        ),
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+            data = self.decode(data)
+            self.check_pixels(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(';base64,')
+        encoded_size = len(data) - start
+        if not encoded_size or encoded_size % 4:
+            self.fail('invalid_base64')
+        padding = 2 if data.endswith('==') else int(data.endswith('='))
+        size = encoded_size // 4 * 3 - padding
+        if size > MAX_IMAGE_SIZE:
+            self.fail('too_large', max_size=MAX_IMAGE_SIZE // 1024 ** 2)
+
+        upload = None
+        try:
+            for offset in range(start, len(data), IMAGE_DECODE_CHUNK_SIZE):
+                chunk = base64.b64decode(
+                    data[offset:offset + IMAGE_DECODE_CHUNK_SIZE],
+                    validate=True
+                )
+                if upload is None:
+                    image_format = detect_image_format(chunk)
+                    if image_format is None:
+                        self.fail('unsupported_format')
+                    upload = self.make_upload(size, *image_format)
+                upload.write(chunk)
+        except binascii.Error:
+            if upload is not None:
+                upload.close()
+            self.fail('invalid_base64')
+        upload.seek(0)
+        return upload
+
+    def make_upload(self, size, extension, content_type):
+        name = f'temp.{extension}'
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            return TemporaryUploadedFile(name, content_type, size, None)
+        return InMemoryUploadedFile(
+            BytesIO(), None, name, content_type, size, None
+        )
+
+    def check_pixels(self, upload):
+        try:
+            with Image.open(upload) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width, height = MAX_IMAGE_PIXELS, 2
+        except Exception:
+            # Некорректное изображение отклонит проверка ImageField.
+            width = height = 0
+        upload.seek(0)
+        if width * height > MAX_IMAGE_PIXELS:
+            upload.close()
+            self.fail('too_many_pixels', max_pixels=MAX_IMAGE_PIXELS)
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    URL уменьшенных копий изображения по размерам и форматам.
+
+    Пока варианты не построены, возвращается пустой словарь и клиент
+    использует исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for variant in IMAGE_VARIANT_SIZES:
+            if variant not in variants:
+                continue
+            urls[variant] = {}
+            for key, name in variants[variant].items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant][key] = url
+        return urls
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'avatar'
+            'is_subscribed', 'avatar', 'avatar_variants'
         )
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context.get('request').user
-        if user.is_anonymous:
+        if user.is_anonymous or user == obj:
             return False
-        return Subscription.objects.filter(user=user, author=obj).exists()
+        return obj.id in self.get_subscribed_ids(user)
+
+    def get_subscribed_ids(self, user):
+        """
+        Возвращает id авторов, на которых подписан пользователь.
+
+        Множество вычисляется одним запросом и хранится в общем контексте,
+        поэтому вложенные и списочные сериализаторы не делают запрос
+        для каждого автора.
+        """
+        if 'subscribed_ids' not in self.context:
+            self.context['subscribed_ids'] = set(
+                Subscription.objects.filter(user=user).values_list(
+                    'author_id', flat=True
+                )
+            )
+        return self.context['subscribed_ids']
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -106,9 +265,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления ингредиентов при создании рецепта."""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = RecipeIngredient
@@ -129,22 +286,21 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True, default=False
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и обновления рецепта."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     ingredients = RecipeIngredientCreateSerializer(many=True)
     image = Base64ImageField()
 
@@ -175,10 +331,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 'Необходимо добавить хотя бы один ингредиент'
             )
 
-        ingredient_ids = [ingredient['id'].id for ingredient in ingredients]
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError('Ингредиенты повторяются')
 
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        check_missing_ids(ingredient_ids, found, 'Ингредиенты не найдены')
+        for ingredient in ingredients:
+            ingredient['ingredient'] = found[ingredient['id']]
         return ingredients
 
     def validate_tags(self, tags):
@@ -192,7 +352,10 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Теги не должны повторяться'
             )
-        return tags
+
+        found = Tag.objects.in_bulk(tags)
+        check_missing_ids(tags, found, 'Теги не найдены')
+        return [found[tag_id] for tag_id in tags]
 
     def create_ingredients(self, recipe, ingredients):
         """Создает связи между рецептом и ингредиентами."""
@@ -201,37 +364,164 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             recipe_ingredients.append(
                 RecipeIngredient(
                     recipe=recipe,
-                    ingredient=ingredient_data['id'],
+                    ingredient=ingredient_data['ingredient'],
                     amount=ingredient_data['amount']
                 )
             )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        return RecipeIngredient.objects.bulk_create(recipe_ingredients)
+
+    LOADED_RELATIONS = ('tags', 'recipe_ingredients')
+
+    def remember_relations(self, recipe):
+        """
+        Запоминает загруженные теги и ингредиенты рецепта для ответа.
+
+        UpdateModelMixin сбрасывает кэш предзагрузки после сохранения,
+        поэтому to_representation подставляет связи заново.
+        """
+        self.loaded_relations = {
+            name: list(getattr(recipe, name).all())
+            for name in self.LOADED_RELATIONS
+        }
 
     def create(self, validated_data):
-        """Создает новый рецепт."""
+        """
+        Создает новый рецепт.
+
+        Теги и ингредиенты уже загружены при валидации, поэтому ответ
+        строится из них без повторных запросов.
+        """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user,
-            **validated_data
-        )
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        author = self.context['request'].user
+        with transaction.atomic():
+            recipe = Recipe.objects.create(author=author, **validated_data)
+            recipe.tags.set(tags)
+            recipe_ingredients = self.create_ingredients(recipe, ingredients)
+        set_prefetched(recipe, 'tags', tags)
+        set_prefetched(recipe, 'recipe_ingredients', recipe_ingredients)
+        self.remember_relations(recipe)
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
         return recipe
 
+    def update_ingredients(self, instance, ingredients):
+        """
+        Приводит ингредиенты рецепта к переданным, меняя только отличия.
+
+        Возвращает True, если в БД что-то изменилось.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in instance.recipe_ingredients.all()
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        new_amounts = {
+            item['id']: item['amount'] for item in ingredients
+        }
+        ingredients_by_id = {
+            item['id']: item['ingredient'] for item in ingredients
+        }
+        if old_amounts == new_amounts:
+            return False
+
+        deleted = [
+            item.pk for ingredient_id, item in current.items()
+            if ingredient_id not in new_amounts
+        ]
+        changed = []
+        created = []
+        for ingredient_id, amount in new_amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                created.append(RecipeIngredient(
+                    recipe=instance,
+                    ingredient=ingredients_by_id[ingredient_id],
+                    amount=amount
+                ))
+            elif item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+
+        if deleted:
+            RecipeIngredient.objects.filter(pk__in=deleted).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        ShoppingListItem.objects.change_recipe(
+            instance.pk, old_amounts, new_amounts
+        )
+        set_prefetched(instance, 'recipe_ingredients', sorted(
+            (
+                item for ingredient_id, item in current.items()
+                if ingredient_id in new_amounts
+            ),
+            key=lambda item: item.pk
+        ) + created)
+        return True
+
+    def update_tags(self, instance, tags):
+        """Добавляет и удаляет только изменившиеся теги рецепта."""
+        current = {tag.id for tag in instance.tags.all()}
+        new = {tag.id for tag in tags}
+        if current == new:
+            return False
+        if current - new:
+            instance.tags.remove(*(current - new))
+        if new - current:
+            instance.tags.add(*(new - current))
+        set_prefetched(instance, 'tags', sorted(tags, key=lambda tag: tag.id))
+        return True
+
+    def is_changed(self, instance, attr, value):
+        """
+        Проверяет, отличается ли новое значение поля от сохранённого.
+
+        Загруженный файл сравнивается по имени, которое хранилище даст ему
+        по содержимому: повторная загрузка того же изображения изменением
+        не считается.
+        """
+        current = getattr(instance, attr)
+        storage = getattr(current, 'storage', None)
+        if hasattr(value, 'chunks') and hasattr(storage, 'get_hashed_name'):
+            name = current.field.generate_filename(instance, value.name)
+            return storage.get_hashed_name(name, value) != current.name
+        return current != value
+
     def update(self, instance, validated_data):
-        """Обновляет существующий рецепт."""
+        """
+        Обновляет рецепт, записывая в БД только изменившиеся данные.
+
+        Если ничего не изменилось, запросов на запись не выполняется.
+        """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        changed_fields = [
+            attr for attr, value in validated_data.items()
+            if self.is_changed(instance, attr, value)
+        ]
 
-        instance.tags.set(tags)
-        instance.recipe_ingredients.all().delete()
-        self.create_ingredients(instance, ingredients)
-
-        return super().update(instance, validated_data)
+        with transaction.atomic():
+            ShoppingListItem.objects.lock_recipes([instance.pk])
+            ingredients_changed = self.update_ingredients(
+                instance, ingredients
+            )
+            tags_changed = self.update_tags(instance, tags)
+            if changed_fields or ingredients_changed or tags_changed:
+                for attr in changed_fields:
+                    setattr(instance, attr, validated_data[attr])
+                instance.save(update_fields=changed_fields + ['updated_at'])
+        self.remember_relations(instance)
+        return instance
 
     def to_representation(self, instance):
         """Преобразует объект в представление для ответа."""
+        for name, objects in getattr(self, 'loaded_relations', {}).items():
+            set_prefetched(instance, name, objects)
         serializer = RecipeSerializer(
             instance,
             context={'request': self.context.get('request')}
@@ -242,9 +532,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для компактного отображения рецепта в списках."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class UserWithRecipesSerializer(UserSerializer):
@@ -258,14 +550,11 @@ class UserWithRecipesSerializer(UserSerializer):
 
     def get_recipes(self, obj):
         """Возвращает рецепты пользователя с учетом лимита."""
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
-
-        return RecipeMinifiedSerializer(recipes, many=True).data
+        if not hasattr(obj, 'limited_recipes'):
+            attach_author_recipes(
+                [obj], get_recipes_limit(self.context.get('request'))
+            )
+        return RecipeMinifiedSerializer(obj.limited_recipes, many=True).data
 
 
 class SetAvatarSerializer(serializers.ModelSerializer):
@@ -345,7 +634,18 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         request = self.context.get('request')
+        attach_author_recipes([instance.author], get_recipes_limit(request))
         return UserWithRecipesSerializer(
             instance.author,
             context={'request': request}
         ).data
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id для массовых действий."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS
+    )
@@ -0,0 +1,203 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import Subscription, User
+
+from .cache import (
+    COUNTS_NAMESPACE,
+    INGREDIENTS_NAMESPACE,
+    RECIPES_NAMESPACE,
+    TAGS_NAMESPACE,
+    bump_version,
+    recipe_namespace,
+)
+
+USER_PUBLIC_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar')
+)
+
+SEARCH_FIELDS = frozenset(('name', 'text'))
+
+RELATION_COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe_id'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe_id'),
+    Subscription: (User, 'subscribers_count', 'author_id'),
+}
+
+
+def invalidate(*namespaces):
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def invalidate_counts():
+    invalidate(COUNTS_NAMESPACE)
+
+
+def update_counter(model, obj_ids, field, delta):
+    """Атомарно изменяет денормализованный счётчик объектов."""
+    model.objects.filter(id__in=obj_ids).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def update_relation_counter(model_class, obj_ids, delta):
+    """Обновляет счётчик объекта, на который ссылается отношение."""
+    if model_class in RELATION_COUNTERS:
+        model, field, _ = RELATION_COUNTERS[model_class]
+        update_counter(model, obj_ids, field, delta)
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает кэш списков и страниц указанных рецептов."""
+    invalidate(
+        RECIPES_NAMESPACE,
+        *(recipe_namespace(recipe_id) for recipe_id in recipe_ids)
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def relation_changed(sender, instance, created=False, **kwargs):
+    """
+    Обновляет счётчик объекта и сбрасывает кэш количеств.
+
+    Сюда попадают правки через админку и каскадное удаление вместе с
+    пользователем или рецептом; API меняет отношения запросами в обход
+    сигналов и вызывает update_relation_counter сам.
+    """
+    if created or kwargs['signal'] is post_delete:
+        delta = 1 if created else -1
+        _, _, obj_field = RELATION_COUNTERS[sender]
+        update_relation_counter(
+            sender, [getattr(instance, obj_field)], delta
+        )
+    invalidate_counts()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, created=False, update_fields=None,
+                   **kwargs):
+    """
+    Обновляет счётчик рецептов автора и сбрасывает кэш рецепта и количеств.
+
+    Количество в выдаче поиска зависит от названия и описания, поэтому
+    оно сбрасывается и при их изменении.
+    """
+    deleted = kwargs['signal'] is post_delete
+    if created or deleted:
+        update_counter(
+            User, [instance.author_id], 'recipes_count', 1 if created else -1
+        )
+    if (
+        created or deleted
+        or update_fields is None or SEARCH_FIELDS & set(update_fields)
+    ):
+        invalidate_counts()
+    invalidate_recipes([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Убирает удаляемый рецепт из агрегатов списков покупок."""
+    ShoppingListItem.objects.remove_recipe_from_carts(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Отмечает рецепт изменённым при правке его ингредиентов."""
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse and action == 'pre_clear':
+        touch_recipes(instance.recipes.all())
+    if not action.startswith('post_'):
+        return
+    invalidate_counts()
+    if reverse:
+        if pk_set:
+            touch_recipes(Recipe.objects.filter(id__in=pk_set))
+        invalidate(RECIPES_NAMESPACE, TAGS_NAMESPACE)
+    else:
+        invalidate_recipes([instance.pk])
+
+
+def touch_recipes(recipes):
+    """
+    Отмечает рецепты изменёнными, когда меняются связанные с ними данные.
+
+    updated_at используется как валидатор условных запросов, поэтому
+    обновляется и при переименовании тегов, ингредиентов и автора.
+    """
+    recipe_ids = list(recipes.values_list('id', flat=True))
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+    invalidate_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate(RECIPES_NAMESPACE, TAGS_NAMESPACE)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_recipes_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate(INGREDIENTS_NAMESPACE)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_recipes_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает кэш рецептов автора при изменении его профиля."""
+    if created:
+        invalidate_counts()
+    elif update_fields is None or USER_PUBLIC_FIELDS & set(update_fields):
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, **kwargs):
+    invalidate_counts()
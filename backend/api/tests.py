@@ -0,0 +1,265 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import Subscription, User
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        password='Pass12345!',
+        first_name='Имя',
+        last_name='Фамилия'
+    )
+
+
+def create_recipe(author, name, amounts):
+    """Создаёт рецепт с ингредиентами {ингредиент: количество}."""
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text='Описание',
+        cooking_time=10,
+        image='recipes/images/recipe.png'
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in amounts.items()
+    )
+    return recipe
+
+
+class RelationEndpointsTests(APITestCase):
+    """Избранное, список покупок и подписки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.user = create_user('user')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        cls.recipe = create_recipe(cls.author, 'Блины', {cls.ingredient: 100})
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_favorite_created(self):
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], self.recipe.id)
+        self.assertTrue(
+            Favorite.objects.filter(user=self.user, recipe=self.recipe)
+            .exists()
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_favorite_duplicate(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_favorite_missing_recipe(self):
+        response = self.client.post('/api/recipes/0/favorite/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_favorite_deleted(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_shopping_cart_created(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+
+    def test_shopping_cart_missing_recipe(self):
+        response = self.client.post('/api/recipes/0/shopping_cart/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], self.author.id)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_subscribe_to_self(self):
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_subscribe_missing_author(self):
+        response = self.client.post('/api/users/0/subscribe/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_counters_after_user_deleted(self):
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.user.delete()
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_recipes_count(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+class ShoppingListTests(APITestCase):
+    """Агрегат списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.user = create_user('user')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.flour, cls.milk, cls.eggs = Ingredient.objects.bulk_create([
+            Ingredient(name='Мука', measurement_unit='г'),
+            Ingredient(name='Молоко', measurement_unit='мл'),
+            Ingredient(name='Яйца', measurement_unit='шт'),
+        ])
+        cls.pancakes = create_recipe(
+            cls.author, 'Блины', {cls.flour: 200, cls.milk: 500}
+        )
+        cls.omelette = create_recipe(
+            cls.author, 'Омлет', {cls.milk: 100, cls.eggs: 3}
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get_totals(self, user=None):
+        return dict(
+            ShoppingListItem.objects.filter(user=user or self.user)
+            .values_list('ingredient_id', 'total_amount')
+        )
+
+    def add_to_cart(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cart_changes(self):
+        self.add_to_cart(self.pancakes)
+        self.add_to_cart(self.omelette)
+        self.assertEqual(
+            self.get_totals(),
+            {self.flour.id: 200, self.milk.id: 600, self.eggs.id: 3}
+        )
+
+        response = self.client.delete(
+            f'/api/recipes/{self.pancakes.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.get_totals(), {self.milk.id: 100, self.eggs.id: 3}
+        )
+
+    def test_bulk_cart_changes(self):
+        missing_id = self.omelette.id + 1
+        response = self.client.post(
+            '/api/recipes/shopping_cart/bulk/',
+            {'ids': [self.pancakes.id, self.omelette.id, missing_id]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {item['id']: item['status'] for item in response.data['results']},
+            {
+                self.pancakes.id: 'created',
+                self.omelette.id: 'created',
+                missing_id: 'not_found',
+            }
+        )
+        self.assertEqual(
+            self.get_totals(),
+            {self.flour.id: 200, self.milk.id: 600, self.eggs.id: 3}
+        )
+
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/bulk/',
+            {'ids': [self.omelette.id]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_totals(), {self.flour.id: 200, self.milk.id: 500}
+        )
+
+    def test_recipe_ingredients_edited(self):
+        self.add_to_cart(self.pancakes)
+        self.add_to_cart(self.omelette)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.pancakes.id}/',
+            {
+                'name': 'Блины',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': self.milk.id, 'amount': 300},
+                    {'id': self.eggs.id, 'amount': 2},
+                ],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_totals(), {self.milk.id: 400, self.eggs.id: 5}
+        )
+        self.assertEqual(self.get_totals(self.author), {})
+
+    def test_recipe_deleted(self):
+        self.add_to_cart(self.pancakes)
+        self.add_to_cart(self.omelette)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.omelette.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.get_totals(), {self.flour.id: 200, self.milk.id: 500}
+        )
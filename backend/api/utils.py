@@ -0,0 +1,65 @@
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import Recipe
+
+
+def get_recipes_limit(request):
+    """Возвращает значение параметра recipes_limit или None."""
+    limit = request.query_params.get('recipes_limit')
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
+
+def attach_author_recipes(authors, limit=None):
+    """
+    Загружает последние рецепты авторов одним запросом.
+
+    Рецепты нумеруются через ROW_NUMBER() в разрезе автора, поэтому
+    ограничение recipes_limit применяется в БД сразу для всей страницы.
+    Каждому автору проставляется атрибут limited_recipes, общее количество
+    рецептов хранится в поле recipes_count.
+    """
+    authors = list(authors)
+    if not authors:
+        return authors
+
+    ranked = Recipe.objects.filter(author__in=authors).only(
+        'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time'
+    ).annotate(
+        recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )
+    ).order_by()
+    sql, params = ranked.query.sql_with_params()
+    sql = f'SELECT * FROM ({sql}) AS ranked'
+    if limit is not None:
+        sql += ' WHERE recipe_rank <= %s'
+        params += (limit,)
+    sql += ' ORDER BY author_id, recipe_rank'
+
+    recipes_by_author = {}
+    for recipe in Recipe.objects.raw(sql, params):
+        recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+
+    for author in authors:
+        author.limited_recipes = recipes_by_author.get(author.id, [])
+    return authors
+
+
+def set_prefetched(instance, name, objects):
+    """
+    Подставляет уже загруженные объекты в кэш предзагрузки связи name.
+
+    Сериализатор затем читает связь так же, как после prefetch_related,
+    не обращаясь к БД.
+    """
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[name] = queryset
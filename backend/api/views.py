@@ -1,26 +1,55 @@
-from django.db.models import Count, Exists, OuterRef, Prefetch, Sum
-from django.http import HttpResponse
+import hashlib
+
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from core.constants import INGREDIENT_SEARCH_LIMIT, SHOPPING_LIST_CHUNK_SIZE
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Subscription, User
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import CollectionActionMixin, SubscriptionActionMixin
+from .cache import (
+    INGREDIENTS_NAMESPACE,
+    RECIPES_NAMESPACE,
+    TAGS_NAMESPACE,
+    LocalCache,
+    cached_response,
+    get_version,
+    make_key,
+    normalize_query,
+    recipe_namespace,
+)
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .fragments import render_recipes
+from .mixins import (
+    CollectionActionMixin,
+    LocalCacheMixin,
+    SubscriptionActionMixin,
+)
 from .pagination import CustomPagination
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (
+    FormatParamNegotiation,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+    ShoppingListTextRenderer,
+)
+from .search import ingredient_index
 from .serializers import (
     FavoriteSerializer,
     IngredientSerializer,
@@ -34,6 +63,7 @@ from .serializers import (
     UserSerializer,
     UserWithRecipesSerializer,
 )
+from .utils import attach_author_recipes, get_recipes_limit
 
 
 class UserViewSet(DjoserUserViewSet, SubscriptionActionMixin):
@@ -42,6 +72,21 @@ class UserViewSet(DjoserUserViewSet, SubscriptionActionMixin):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = CustomPagination
+    cursor_ordering = ('username', 'id')
+
+    def get_queryset(self):
+        """Добавляет к пользователям признак подписки текущего пользователя."""
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('pk')
+                    )
+                )
+            )
+        return queryset
 
     def get_permissions(self):
         """Определяет необходимые разрешения в зависимости от действия."""
@@ -58,9 +103,11 @@ class UserViewSet(DjoserUserViewSet, SubscriptionActionMixin):
         """Возвращает список авторов, на которых подписан пользователь."""
         user = request.user
         subscriptions = User.objects.filter(subscribers__user=user).annotate(
-            recipes_count=Count('recipes')
+            is_subscribed=Value(True)
+        )
+        page = attach_author_recipes(
+            self.paginate_queryset(subscriptions), get_recipes_limit(request)
         )
-        page = self.paginate_queryset(subscriptions)
         serializer = UserWithRecipesSerializer(
             page, many=True, context={'request': request}
         )
@@ -80,6 +127,19 @@ class UserViewSet(DjoserUserViewSet, SubscriptionActionMixin):
             serializer_class=SubscriptionSerializer
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='subscribe/bulk'
+    )
+    def subscribe_bulk(self, request):
+        """Подписывает/отписывает от нескольких авторов сразу."""
+        return self.handle_bulk_subscription_action(
+            request=request,
+            model_class=Subscription
+        )
+
     @action(
         detail=False,
         methods=['post'],
@@ -129,26 +189,48 @@ class UserViewSet(DjoserUserViewSet, SubscriptionActionMixin):
 
         if request.method == 'DELETE':
             if user.avatar:
-                user.avatar.delete()
+                # Файл может использоваться другими объектами: при
+                # сохранении ставится задача, которая освободит его
+                # после проверки ссылок.
+                user.avatar = None
+                user.save(update_fields=['avatar'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(LocalCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с тегами (только чтение)."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    local_cache = LocalCache(TAGS_NAMESPACE)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(LocalCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с ингредиентами (только чтение)."""
 
     queryset = Ingredient.objects.all()
+    local_cache = LocalCache(INGREDIENTS_NAMESPACE)
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов.
+
+        Поиск по name выполняется по индексу в памяти: сначала совпадения
+        по началу названия, затем по подстроке. Выдача ограничена
+        INGREDIENT_SEARCH_LIMIT; параметр limit может только уменьшить её.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        if limit and limit.isdigit():
+            limit = min(int(limit), INGREDIENT_SEARCH_LIMIT)
+        else:
+            limit = INGREDIENT_SEARCH_LIMIT
+        return Response(ingredient_index.search(name, limit))
 
 
 class RecipeViewSet(viewsets.ModelViewSet, CollectionActionMixin):
@@ -157,19 +239,30 @@ class RecipeViewSet(viewsets.ModelViewSet, CollectionActionMixin):
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthorOrReadOnly]
     pagination_class = CustomPagination
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
     ordering = ('-pub_date',)
+    cursor_ordering = ('-pub_date', '-id')
 
     def get_queryset(self):
-        """Возвращает базовый QuerySet с оптимизацией запросов."""
-        queryset = Recipe.objects.select_related('author').prefetch_related(
-            'tags',
-            Prefetch(
-                'recipe_ingredients',
-                queryset=RecipeIngredient.objects.select_related('ingredient')
+        """
+        Возвращает базовый QuerySet с оптимизацией запросов.
+
+        Для списка и детальной страницы связанные объекты не загружаются:
+        представление собирается из кэша фрагментов, а из БД берутся
+        только рецепты страницы с признаками текущего пользователя.
+        """
+        queryset = Recipe.objects.defer('search_vector')
+        if self.action not in ('list', 'retrieve'):
+            queryset = queryset.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                )
             )
-        )
 
         user = self.request.user
         if user.is_authenticated:
@@ -183,11 +276,91 @@ class RecipeViewSet(viewsets.ModelViewSet, CollectionActionMixin):
                     ShoppingCart.objects.filter(
                         user=user, recipe=OuterRef('pk')
                     )
+                ),
+                is_author_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('author')
+                    )
                 )
             )
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """Список рецептов; анонимные ответы берутся из кэша."""
+        if not request.user.is_anonymous:
+            return self.render_list()
+        key = make_key(
+            RECIPES_NAMESPACE, request.build_absolute_uri(request.path),
+            normalize_query(request)
+        )
+        return cached_response('recipes', key, self.render_list)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Рецепт с поддержкой условных запросов.
+
+        Валидаторы строятся по одному запросу рецепта: ETag учитывает
+        updated_at и признаки текущего пользователя, Last-Modified
+        отдаётся только анонимным пользователям. Тело ответа для
+        анонимных пользователей берётся из кэша.
+        """
+        recipe = self.get_object()
+        etag, last_modified = self.get_detail_validators(recipe)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            if request.user.is_anonymous:
+                key = make_key(
+                    recipe_namespace(recipe.pk),
+                    get_version(TAGS_NAMESPACE),
+                    request.build_absolute_uri(request.path),
+                    normalize_query(request)
+                )
+                response = cached_response(
+                    'recipes', key, lambda: self.render_detail(recipe)
+                )
+            else:
+                response = self.render_detail(recipe)
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_detail_validators(self, recipe):
+        """Возвращает ETag и время изменения (timestamp) рецепта."""
+        flags = (
+            getattr(recipe, 'is_favorited', False),
+            getattr(recipe, 'is_in_shopping_cart', False),
+            getattr(recipe, 'is_author_subscribed', False),
+        )
+        digest = hashlib.md5(
+            f'{recipe.pk}:{recipe.updated_at.isoformat()}:{flags}:'
+            f'{self.request.accepted_renderer.format}'.encode()
+        ).hexdigest()
+        last_modified = None
+        if self.request.user.is_anonymous:
+            last_modified = int(recipe.updated_at.timestamp())
+        return f'"{digest}"', last_modified
+
+    def render_list(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(
+                render_recipes(queryset, self.get_serializer_context())
+            )
+        return self.get_paginated_response(
+            render_recipes(page, self.get_serializer_context())
+        )
+
+    def render_detail(self, recipe):
+        data = render_recipes([recipe], self.get_serializer_context())
+        return Response(data[0])
+
     def get_serializer_class(self):
         """Возвращает класс сериализатора в зависимости от действия."""
         if self.action in ['create', 'update', 'partial_update']:
@@ -210,6 +383,19 @@ class RecipeViewSet(viewsets.ModelViewSet, CollectionActionMixin):
             error_not_found='Рецепт не в избранном'
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='favorite/bulk'
+    )
+    def favorite_bulk(self, request):
+        """Добавляет/удаляет несколько рецептов в избранное."""
+        return self.handle_bulk_collection_action(
+            request=request,
+            model_class=Favorite
+        )
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -226,45 +412,55 @@ class RecipeViewSet(viewsets.ModelViewSet, CollectionActionMixin):
             error_not_found='Рецепт не в списке покупок'
         )
 
-    def _create_shopping_list_content(self, user):
-        """Создает содержимое списка покупок."""
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoppingcart_by__user=user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
-        ).order_by('ingredient__name')
-
-        shopping_list = [
-            'Список покупок\n\n'
-        ]
-
-        for item in ingredients:
-            name = item['ingredient__name']
-            unit = item['ingredient__measurement_unit']
-            amount = item['total_amount']
-            shopping_list.append(f'{name} ({unit}) — {amount}\n')
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='shopping_cart/bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        """Добавляет/удаляет несколько рецептов в список покупок."""
+        return self.handle_bulk_collection_action(
+            request=request,
+            model_class=ShoppingCart
+        )
 
-        return ''.join(shopping_list)
+    def get_shopping_list_items(self, user):
+        """Возвращает итератор по строкам списка покупок пользователя."""
+        return ShoppingListItem.objects.filter(user=user).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            amount=F('total_amount')
+        ).order_by('ingredient__name').iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE
+        )
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[permissions.IsAuthenticated]
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ),
+        content_negotiation_class=FormatParamNegotiation
     )
     def download_shopping_cart(self, request):
-        """Скачивает список покупок пользователя в формате txt."""
-        user = request.user
-        content = self._create_shopping_list_content(user)
-
-        response = HttpResponse(
-            content=content,
-            content_type='text/plain'
+        """Скачивает список покупок в формате txt, csv или json."""
+        renderer = request.accepted_renderer
+        items = self.get_shopping_list_items(request.user)
+
+        response = StreamingHttpResponse(
+            (
+                chunk.encode(renderer.charset)
+                for chunk in renderer.stream(items)
+            ),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{renderer.get_filename()}"'
         )
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.txt"'
-                                           )
         return response
 
     @action(detail=True, methods=['get'], url_path='get-link')
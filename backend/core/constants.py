@@ -11,3 +11,34 @@ MAX_SLUG_LENGTH = 32
 MAX_TAG_LENGTH = 32
 
 MAX_RECIPE_NAME_LENGTH = 256
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+INGREDIENT_SEARCH_LIMIT = 100
+
+MAX_BULK_IDS = 100
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+
+MAX_IMAGE_PIXELS = 25_000_000
+
+# Кратно 4, чтобы каждая часть base64 декодировалась независимо.
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (b'GIF87a', 'gif', 'image/gif'),
+    (b'GIF89a', 'gif', 'image/gif'),
+)
+
+IMAGE_VARIANT_SIZES = {
+    'thumbnail': (160, 160),
+    'card': (640, 640),
+    'full': (1600, 1600),
+}
+
+IMAGE_VARIANT_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 85, 'optimize': True}),
+}
@@ -0,0 +1,66 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from core.constants import IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_SIZES
+
+
+def variant_name(upload_to, variant, extension):
+    """
+    Возвращает имя для сохранения варианта в каталоге загрузки поля.
+
+    Хранилище переименовывает файл по хешу содержимого, поэтому имя
+    задаёт только каталог и расширение.
+    """
+    return str(
+        PurePosixPath(upload_to) / 'variants' / f'{variant}.{extension}'
+    )
+
+
+def to_rgb(image):
+    """Переводит изображение в RGB, накладывая прозрачность на белый фон."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_variants(field_file, storage=default_storage):
+    """
+    Создаёт уменьшенные копии изображения во всех размерах и форматах.
+
+    Изображения меньше целевого размера не увеличиваются. Возвращает
+    словарь {'source': имя исходника, вариант: {формат: имя файла}}.
+    """
+    with field_file.open('rb') as source, Image.open(source) as image:
+        image = to_rgb(ImageOps.exif_transpose(image))
+
+    variants = {'source': field_file.name}
+    for variant, size in IMAGE_VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for key, (extension, image_format, options) in (
+            IMAGE_VARIANT_FORMATS.items()
+        ):
+            buffer = BytesIO()
+            resized.save(buffer, format=image_format, **options)
+            name = variant_name(field_file.field.upload_to, variant, extension)
+            variants[variant][key] = storage.save(
+                name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def variant_files(variants):
+    """Возвращает имена файлов вариантов изображения."""
+    return [
+        name
+        for variant in IMAGE_VARIANT_SIZES
+        for name in variants.get(variant, {}).values()
+    ]
@@ -0,0 +1,64 @@
+class CounterFieldsMixin:
+    """
+    Миксин для моделей с денормализованными счётчиками.
+
+    Счётчики меняются только выражениями F(), поэтому при полном
+    сохранении уже существующего объекта они исключаются из UPDATE,
+    чтобы не перезаписать их устаревшими значениями из памяти. Остальные
+    поля сравниваются со значениями, загруженными из БД, и в
+    update_fields попадают только изменившиеся: обработчики сигналов
+    видят, что действительно поменялось.
+    """
+
+    counter_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_loaded_values()
+
+    def get_loaded_fields(self):
+        """Возвращает поля с загруженными значениями и эти значения."""
+        return {
+            field: field.get_prep_value(field.value_from_object(self))
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def remember_loaded_values(self):
+        self._loaded_values = {
+            field.attname: value
+            for field, value in self.get_loaded_fields().items()
+        }
+
+    def get_loaded_values(self):
+        """Возвращает значения полей по attname, загруженные из БД."""
+        return dict(getattr(self, '_loaded_values', {}))
+
+    def get_changed_fields(self):
+        """Возвращает поля, изменившиеся с момента загрузки из БД."""
+        loaded = getattr(self, '_loaded_values', {})
+        current = self.get_loaded_fields()
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.name in self.counter_fields:
+                continue
+            if getattr(field, 'auto_now', False):
+                changed.append(field.name)
+            elif field in current and (
+                field.attname not in loaded
+                or current[field] != loaded[field.attname]
+            ):
+                changed.append(field.name)
+        return changed
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self.get_changed_fields()
+        super().save(*args, **kwargs)
+        self.remember_loaded_values()
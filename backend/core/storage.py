@@ -0,0 +1,42 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, именующее файлы по SHA-256 содержимого.
+
+    Файл сохраняется как <каталог>/<первые два символа хеша>/<хеш>.<ext>,
+    где каталог берётся из upload_to поля. Одинаковые загрузки попадают
+    в один файл, а имя никогда не указывает на другое содержимое, поэтому
+    URL можно кешировать бессрочно. Файлы могут разделяться несколькими
+    объектами: удалять их следует через проверку ссылок, а не напрямую.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            # Обновляем время изменения: файл снова используется, и
+            # отложенное удаление не должно его трогать.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def get_hashed_name(self, name, content):
+        """Возвращает имя файла по хешу его содержимого."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
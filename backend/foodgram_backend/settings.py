@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -24,6 +25,7 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'core.apps.CoreConfig',
     'recipes.apps.RecipesConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
@@ -98,8 +100,53 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+
+MEDIA_RELEASE_GRACE = 60 * 60
+
 AUTH_USER_MODEL = 'users.User'
 
+# Версии пространств имён и кэш ответов должны быть общими для
+# веб-воркеров, обработчика задач и management-команд: при заданном
+# CACHE_LOCATION используется memcached. Без него — кэш в памяти процесса,
+# пригодный только для разработки в одном процессе.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or (
+            'django.core.cache.backends.memcached.PyMemcacheCache'
+            if CACHE_LOCATION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+
+CACHE_STATS_FLUSH_INTERVAL = 10
+
+PAGINATION_COUNT_CACHE_TIMEOUT = 60 * 5
+
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+LOCAL_CACHE_CHECK_INTERVAL = 5
+
+LOCAL_CACHE_MAX_AGE = 60 * 5
+
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD') or 0
+)
+
+JOB_VISIBILITY_TIMEOUT = 60 * 5
+
+JOB_MAX_ATTEMPTS = 5
+
+JOB_RETRY_DELAY = 30
+
+JOB_POLL_INTERVAL = 1
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'status', 'attempts', 'run_after', 'created_at',
+        'finished_at'
+    )
+    list_display_links = ('name',)
+    list_filter = ('status', 'name')
+    readonly_fields = ('last_error',)
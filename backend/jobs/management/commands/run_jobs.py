@@ -0,0 +1,59 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim, run
+
+
+class Command(BaseCommand):
+    """Команда обработчика фоновых задач."""
+
+    help = 'Выполняет фоновые задачи из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10,
+            help='Количество задач, забираемых за один раз'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.JOB_POLL_INTERVAL,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+
+    def handle(self, *args, **options):
+        """Забирает и выполняет задачи до сигнала завершения."""
+        backend = settings.CACHES['default']['BACKEND']
+        if backend.endswith(('.LocMemCache', '.DummyCache')):
+            # Задачи сбрасывают кэш веб-процессов через версии в общем
+            # кэше; с кэшем в памяти процесса сброс до них не дойдёт.
+            self.stderr.write(
+                f'Кэш {backend} не общий для процессов: изменения, '
+                f'сделанные задачами, не сбросят кэш веб-приложения'
+            )
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            close_old_connections()
+            jobs = claim(options['batch_size'])
+            for job in jobs:
+                succeeded = run(job)
+                self.stdout.write(
+                    f'{job}: {"выполнена" if succeeded else "ошибка"}'
+                )
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+    def stop(self, signum, frame):
+        """Завершает работу после текущей пачки задач."""
+        self.stopping = True
@@ -0,0 +1,125 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрирует функцию как фоновую задачу с именем name."""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=None, max_attempts=None, **payload):
+    """
+    Ставит задачу в очередь.
+
+    Запись создаётся в текущей транзакции, поэтому задача становится
+    видна обработчикам только вместе с данными, которые её породили.
+    Параметры должны сериализоваться в JSON.
+    """
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + (delay or timedelta())
+    )
+
+
+def claim(batch_size):
+    """
+    Забирает готовые к выполнению задачи.
+
+    Строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько обработчиков не получают одну задачу. Задачи, обработчик
+    которых не уложился в JOB_VISIBILITY_TIMEOUT, выдаются повторно, а
+    исчерпавшие max_attempts отмечаются как failed.
+    """
+    now = timezone.now()
+    expired = Q(status=Job.RUNNING, locked_until__lt=now)
+    exhausted = Q(attempts__gte=F('max_attempts'))
+    with transaction.atomic():
+        failed = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                expired & exhausted
+            ).values_list('id', flat=True)
+        )
+        if failed:
+            logger.warning(
+                'Задачи %s не завершились за отведённое время', failed
+            )
+            Job.objects.filter(id__in=failed).update(
+                status=Job.FAILED,
+                locked_until=None,
+                last_error='Превышено время выполнения',
+                finished_at=now
+            )
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.QUEUED, run_after__lte=now)
+                | expired & ~exhausted
+            ).order_by('run_after', 'id').values_list('id', flat=True)[
+                :batch_size
+            ]
+        )
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(
+                seconds=settings.JOB_VISIBILITY_TIMEOUT
+            )
+        )
+    return list(Job.objects.filter(id__in=ids).order_by('run_after', 'id'))
+
+
+def run(job):
+    """
+    Выполняет задачу.
+
+    Успешная задача удаляется, неуспешная возвращается в очередь с
+    экспоненциальной задержкой, а после max_attempts попыток остаётся
+    со статусом failed. Условие по attempts не даёт обработчику, у
+    которого истёк таймаут, перезаписать состояние повторной выдачи.
+    Возвращает True при успехе.
+    """
+    current = Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, attempts=job.attempts
+    )
+    try:
+        func = TASKS.get(job.name)
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        func(**job.payload)
+    except Exception:
+        logger.exception('Задача %s завершилась с ошибкой', job)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            current.update(
+                status=Job.FAILED,
+                locked_until=None,
+                last_error=error,
+                finished_at=timezone.now()
+            )
+        else:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            current.update(
+                status=Job.QUEUED,
+                locked_until=None,
+                last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay)
+            )
+        return False
+    current.delete()
+    return True
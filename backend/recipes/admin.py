@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 
 from .models import (
     Favorite,
@@ -7,6 +6,7 @@ from .models import (
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
@@ -31,12 +31,13 @@ class RecipeAdmin(admin.ModelAdmin):
         return queryset.select_related('author').prefetch_related(
             'tags',
             'recipe_ingredients__ingredient'
-        ).annotate(favorites_count=Count('favorite_by'))
-
-    def favorites_count(self, obj):
-        return obj.favorites_count
+        )
 
-    favorites_count.short_description = 'В избранном'
+    def save_related(self, request, form, formsets, change):
+        """Пересчитывает списки покупок при изменении ингредиентов."""
+        super().save_related(request, form, formsets, change)
+        if any(formset.has_changed() for formset in formsets):
+            ShoppingListItem.objects.rebuild_for_recipes([form.instance.pk])
 
 
 @admin.register(Tag)
@@ -73,6 +74,21 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'recipe')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild(
+            {obj.user_id, form.initial.get('user', obj.user_id)}
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild([obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild(user_ids)
+
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -84,3 +100,20 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related(
             'recipe', 'ingredient'
         )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild_for_recipes(
+            {obj.recipe_id, form.initial.get('recipe', obj.recipe_id)}
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild_for_recipes([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(
+            queryset.values_list('recipe_id', flat=True).distinct()
+        )
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.rebuild_for_recipes(recipe_ids)
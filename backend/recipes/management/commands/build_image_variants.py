@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from api.images import IMAGE_FIELDS, generate_variants, needs_variants
+
+
+class Command(BaseCommand):
+    """Команда для построения вариантов изображений рецептов и аватаров."""
+
+    help = 'Строит недостающие уменьшенные копии изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить варианты для всех изображений'
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает объекты последовательно в текущем процессе."""
+        for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+            built = 0
+            objects = model.objects.only(
+                image_field, variants_field
+            ).iterator()
+            for obj in objects:
+                force = options['force'] and bool(getattr(obj, image_field))
+                if force or needs_variants(obj):
+                    built += generate_variants(model, obj.pk, force=force)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано {built}'
+            )
@@ -0,0 +1,99 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from api.images import IMAGE_FIELDS
+from core.images import variant_files
+
+
+class Command(BaseCommand):
+    """Команда для удаления медиафайлов, на которые не ссылаются объекты."""
+
+    help = 'Удаляет неиспользуемые изображения рецептов и аватары'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество объектов, читаемых из БД за один запрос'
+        )
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help=(
+                'Не трогать файлы моложе указанного числа секунд '
+                '(по умолчанию MEDIA_RELEASE_GRACE)'
+            )
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать неиспользуемые файлы, не удаляя их'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Сверяет файлы каталогов загрузки со ссылками из БД.
+
+        Ссылки собираются до обхода каталогов, поэтому файлы, загруженные
+        или повторно использованные позже, защищены периодом ожидания.
+        """
+        grace = options['grace']
+        if grace is None:
+            grace = settings.MEDIA_RELEASE_GRACE
+        threshold = (timezone.now() - timedelta(seconds=grace)).timestamp()
+        referenced = self.get_references(options['batch_size'])
+
+        scanned = orphaned = size = 0
+        for directory in self.get_directories():
+            for name, stat in self.scan(directory):
+                scanned += 1
+                if name in referenced or stat.st_mtime > threshold:
+                    continue
+                orphaned += 1
+                size += stat.st_size
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+                if not options['dry_run']:
+                    default_storage.delete(name)
+
+        action = 'найдено' if options['dry_run'] else 'удалено'
+        self.stdout.write(
+            f'Проверено файлов: {scanned}, ссылок в БД: {len(referenced)}, '
+            f'{action} неиспользуемых: {orphaned} ({size} байт)'
+        )
+
+    def get_references(self, batch_size):
+        """Собирает имена файлов изображений и их вариантов из БД."""
+        referenced = set()
+        for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+            rows = model.objects.values_list(
+                image_field, variants_field
+            ).iterator(chunk_size=batch_size)
+            for image, variants in rows:
+                referenced.add(image)
+                referenced.add(variants.get('source'))
+                referenced.update(variant_files(variants))
+        referenced.difference_update({None, ''})
+        return referenced
+
+    def get_directories(self):
+        """Возвращает каталоги загрузки полей изображений."""
+        return sorted({
+            model._meta.get_field(image_field).upload_to.strip('/')
+            for model, (image_field, _) in IMAGE_FIELDS.items()
+        })
+
+    def scan(self, directory):
+        """Обходит каталог, возвращая пары (имя в хранилище, stat)."""
+        path = default_storage.path(directory)
+        if not os.path.isdir(path):
+            return
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.scan(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat(follow_symlinks=False)
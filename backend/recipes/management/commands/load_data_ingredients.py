@@ -1,41 +1,194 @@
 import csv
+import io
+import json
 import logging
+from itertools import islice
 from pathlib import Path
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import INGREDIENTS_NAMESPACE, bump_version
 from recipes.models import Ingredient
 
 logger = logging.getLogger(__name__)
 
+JSON_READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Читает пары (название, единица измерения) из CSV."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """
+    Читает пары (название, единица измерения) из JSON-массива объектов.
+
+    Файл разбирается по частям, поэтому целиком в память не загружается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise ValueError('Ожидается JSON-массив')
+            started = True
+            position += 1
+            continue
+        if started and buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = file.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batched(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
     """Команда для загрузки ингредиентов в базу данных."""
 
-    help = 'Загружает ингредиенты в БД'
+    help = 'Добавляет в БД ингредиенты, которых в ней ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=str(Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'),
+            help='Файл с ингредиентами в формате CSV или JSON'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк, отправляемых в БД за один запрос'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузить файл через COPY во временную таблицу'
+        )
 
     def handle(self, *args, **options):
-        """Выполняет загрузку ингредиентов из CSV-файла."""
-        file_path = Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'
+        """
+        Загружает ингредиенты без удаления существующих.
 
-        Ingredient.objects.all().delete()
+        Строки, совпадающие с уже сохранёнными по названию и единице
+        измерения, пропускаются, поэтому рецепты не затрагиваются, а
+        повторный запуск ничего не меняет.
+        """
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
 
-        ingredients_to_create = []
+        with open(path, 'r', encoding='utf-8') as file:
+            rows = self.clean(reader(file))
+            if options['copy']:
+                total, inserted = self.load_copy(rows, options['batch_size'])
+            else:
+                total, inserted = self.load_batches(
+                    rows, options['batch_size']
+                )
 
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                ingredients_to_create.append(
-                    Ingredient(
-                        name=row[0],
-                        measurement_unit=row[1]
-                    )
+        if inserted:
+            bump_version(INGREDIENTS_NAMESPACE)
+        message = (
+            f'Обработано {total} ингредиентов: добавлено {inserted}, '
+            f'без изменений {total - inserted}, пропущено {self.skipped}'
+        )
+        logger.info(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def clean(self, rows):
+        """Отбрасывает пустые и слишком длинные значения."""
+        self.skipped = 0
+        name_length = Ingredient._meta.get_field('name').max_length
+        unit_length = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        for name, unit in rows:
+            name, unit = name.strip(), unit.strip()
+            if (
+                not name or not unit
+                or len(name) > name_length or len(unit) > unit_length
+            ):
+                self.skipped += 1
+                continue
+            yield name, unit
+
+    def load_batches(self, rows, batch_size):
+        """Вставляет строки пачками, каждая в своей транзакции."""
+        table = Ingredient._meta.db_table
+        total = inserted = 0
+        with connection.cursor() as cursor:
+            for batch in batched(rows, batch_size):
+                values = ', '.join(['(%s, %s)'] * len(batch))
+                cursor.execute(
+                    f'INSERT INTO {table} (name, measurement_unit) '
+                    f'VALUES {values} '
+                    f'ON CONFLICT (name, measurement_unit) DO NOTHING',
+                    [value for row in batch for value in row]
                 )
+                total += len(batch)
+                inserted += cursor.rowcount
+        return total, inserted
 
-        Ingredient.objects.bulk_create(ingredients_to_create)
+    def load_copy(self, rows, batch_size):
+        """
+        Загружает строки через COPY во временную таблицу.
 
-        logger.info(f'Загружено {len(ingredients_to_create)} ингредиентов')
-        self.stdout.write(self.style.SUCCESS(
-            f'Загружено {len(ingredients_to_create)} ингредиентов'
-        ))
+        Перенос в основную таблицу выполняется одним запросом в той же
+        транзакции, поэтому импорт либо проходит целиком, либо не
+        меняет ничего.
+        """
+        table = Ingredient._meta.db_table
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batched(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                total += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredient_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            inserted = cursor.rowcount
+        return total, inserted
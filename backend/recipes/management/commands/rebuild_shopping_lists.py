@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Команда для пересчёта агрегатов списков покупок."""
+
+    help = 'Пересчитывает списки покупок пользователей по их корзинам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        """Удаляет агрегаты и строит их заново в одной транзакции."""
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild(options['user_ids'])
+        self.stdout.write(
+            f'Строк в списках покупок: {ShoppingListItem.objects.count()}'
+        )
@@ -0,0 +1,74 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+)
+
+
+def actual_count(model, field):
+    """Подзапрос с фактическим количеством связанных объектов."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    """Команда для сверки денормализованных счётчиков."""
+
+    help = 'Пересчитывает счётчики избранного, покупок, рецептов и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество объектов, проверяемых за один запрос'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Сверяет счётчики пачками по диапазонам первичного ключа.
+
+        Каждая пачка исправляется одним UPDATE с подзапросом, поэтому
+        инкременты, зафиксированные во время сверки, не перезаписываются
+        прочитанными ранее значениями.
+        """
+        for model, field, related_model, related_field in COUNTERS:
+            fixed = 0
+            actual = actual_count(related_model, related_field)
+            for batch in self.get_batches(model, options['batch_size']):
+                drifted = batch.exclude(**{field: actual})
+                if options['dry_run']:
+                    fixed += drifted.count()
+                else:
+                    fixed += drifted.update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: расхождений {fixed}'
+            )
+
+    def get_batches(self, model, batch_size):
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return
+            yield model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            last_pk = pks[-1]
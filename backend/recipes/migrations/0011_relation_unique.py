@@ -0,0 +1,56 @@
+# Generated by Django 3.2.19 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+DELETE_DUPLICATES = """
+DELETE FROM {table} AS relation USING {table} AS duplicate
+WHERE relation.user_id = duplicate.user_id
+  AND relation.recipe_id = duplicate.recipe_id
+  AND relation.id > duplicate.id;
+"""
+
+RECOUNT = """
+UPDATE recipes_recipe SET
+  favorites_count = (
+    SELECT COUNT(*) FROM recipes_favorite
+    WHERE recipes_favorite.recipe_id = recipes_recipe.id
+  ),
+  in_carts_count = (
+    SELECT COUNT(*) FROM recipes_shoppingcart
+    WHERE recipes_shoppingcart.recipe_id = recipes_recipe.id
+  );
+DELETE FROM recipes_shoppinglistitem;
+INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+FROM recipes_shoppingcart AS cart
+JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+GROUP BY cart.user_id, item.ingredient_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            DELETE_DUPLICATES.format(table='recipes_favorite'),
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            DELETE_DUPLICATES.format(table='recipes_shoppingcart'),
+            migrations.RunSQL.noop
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='recipes_favorite_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='recipes_shoppingcart_unique'),
+        ),
+        migrations.RunSQL(RECOUNT, migrations.RunSQL.noop),
+    ]
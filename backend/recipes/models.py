@@ -1,11 +1,14 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models
 
 from core.constants import (
     MAX_RECIPE_NAME_LENGTH,
     MAX_SLUG_LENGTH,
     MAX_TAG_LENGTH,
 )
+from core.mixins import CounterFieldsMixin
 from users.models import User
 
 
@@ -43,9 +46,11 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -54,6 +59,12 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=MAX_RECIPE_NAME_LENGTH)
     image = models.ImageField('Изображение', upload_to='recipes/images/')
+    image_variants = models.JSONField(
+        'Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -74,11 +85,42 @@ class Recipe(models.Model):
         ]
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+            GinIndex(
+                fields=['name'],
+                name='recipe_name_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -147,7 +189,7 @@ class UserRecipeRelation(models.Model):
 class Favorite(UserRecipeRelation):
     """Модель для хранения избранных рецептов пользователя."""
 
-    class Meta:
+    class Meta(UserRecipeRelation.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
 
@@ -155,6 +197,181 @@ class Favorite(UserRecipeRelation):
 class ShoppingCart(UserRecipeRelation):
     """Модель для хранения рецептов в списке покупок пользователя."""
 
-    class Meta:
+    class Meta(UserRecipeRelation.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+
+
+class ShoppingListItemManager(models.Manager):
+    """
+    Поддерживает агрегат списка покупок в согласованном состоянии.
+
+    Количество меняется одним запросом INSERT ... ON CONFLICT или UPDATE,
+    строки с нулевым количеством удаляются.
+    """
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description is not None:
+                return cursor.fetchall()
+        return None
+
+    def _add(self, source_sql, params):
+        """Прибавляет количества из строк (user_id, ingredient_id, amount)."""
+        table = self.model._meta.db_table
+        self._execute(
+            f'INSERT INTO {table} (user_id, ingredient_id, total_amount) '
+            f'{source_sql} '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE SET '
+            f'total_amount = {table}.total_amount + EXCLUDED.total_amount',
+            params
+        )
+
+    def _subtract(self, source_sql, params):
+        """Вычитает количества из строк (user_id, ingredient_id, amount)."""
+        table = self.model._meta.db_table
+        rows = self._execute(
+            f'WITH source (user_id, ingredient_id, amount) AS ({source_sql}) '
+            f'UPDATE {table} SET total_amount = GREATEST('
+            f'{table}.total_amount - source.amount, 0) FROM source '
+            f'WHERE {table}.user_id = source.user_id '
+            f'AND {table}.ingredient_id = source.ingredient_id '
+            f'RETURNING {table}.id, {table}.total_amount',
+            params
+        )
+        empty_ids = [item_id for item_id, amount in rows if not amount]
+        if empty_ids:
+            self.filter(id__in=empty_ids).delete()
+
+    def _recipe_source(self, carts=False):
+        recipe_ingredients = RecipeIngredient._meta.db_table
+        if not carts:
+            return (
+                f'SELECT %s, ingredient_id, SUM(amount) '
+                f'FROM {recipe_ingredients} WHERE recipe_id = ANY(%s) '
+                f'GROUP BY ingredient_id'
+            )
+        return (
+            f'SELECT cart.user_id, item.ingredient_id, item.amount '
+            f'FROM {ShoppingCart._meta.db_table} AS cart '
+            f'JOIN {recipe_ingredients} AS item '
+            f'ON item.recipe_id = cart.recipe_id '
+            f'WHERE cart.recipe_id = %s'
+        )
+
+    def lock_recipes(self, recipe_ids):
+        """
+        Блокирует строки рецептов до конца транзакции.
+
+        Изменение корзины и правка ингредиентов рецепта берут блокировку
+        до чтения ингредиентов, поэтому при READ COMMITTED одна операция
+        видит зафиксированный результат другой и изменение не теряется.
+        """
+        list(
+            Recipe.objects.select_for_update(no_key=True)
+            .filter(id__in=recipe_ids).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def add_recipes(self, user_id, recipe_ids):
+        """Добавляет ингредиенты рецептов в список покупок пользователя."""
+        self.lock_recipes(recipe_ids)
+        self._add(self._recipe_source(), (user_id, list(recipe_ids)))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Убирает ингредиенты рецептов из списка покупок пользователя."""
+        self.lock_recipes(recipe_ids)
+        self._subtract(self._recipe_source(), (user_id, list(recipe_ids)))
+
+    def remove_recipe_from_carts(self, recipe_id):
+        """Убирает ингредиенты рецепта из всех списков, где он есть."""
+        self._subtract(self._recipe_source(carts=True), (recipe_id,))
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """
+        Применяет изменение ингредиентов рецепта ко всем спискам покупок.
+
+        old_amounts и new_amounts — словари {ingredient_id: amount}.
+        """
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        for sign, apply in ((1, self._add), (-1, self._subtract)):
+            rows = [
+                (ingredient_id, delta * sign)
+                for ingredient_id, delta in deltas.items()
+                if delta * sign > 0
+            ]
+            if not rows:
+                continue
+            values = ', '.join(['(%s, %s)'] * len(rows))
+            params = [value for row in rows for value in row]
+            apply(
+                f'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+                f'FROM {ShoppingCart._meta.db_table} AS cart, '
+                f'(VALUES {values}) AS delta (ingredient_id, amount) '
+                f'WHERE cart.recipe_id = %s',
+                (*params, recipe_id)
+            )
+
+    def rebuild(self, user_ids=None):
+        """Пересчитывает списки покупок пользователей с нуля."""
+        queryset = self.all()
+        carts = ShoppingCart.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+            carts = carts.filter(user_id__in=user_ids)
+        queryset.delete()
+        source = carts.values(
+            'user_id', 'recipe__recipe_ingredients__ingredient_id'
+        ).annotate(
+            total_amount=models.Sum('recipe__recipe_ingredients__amount')
+        ).filter(total_amount__gt=0).order_by()
+        sql, params = source.query.sql_with_params()
+        self._add(sql, params)
+
+    def rebuild_for_recipes(self, recipe_ids):
+        """Пересчитывает списки покупок, в которые входят рецепты."""
+        self.lock_recipes(recipe_ids)
+        self.rebuild(list(
+            ShoppingCart.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('user_id', flat=True).distinct()
+        ))
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.total_amount}'
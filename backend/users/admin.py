@@ -6,7 +6,10 @@ from .models import Subscription, User
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
+    list_display = (
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'subscribers_count', 'is_staff'
+    )
     list_display_links = ('username', 'email')
     search_fields = ('email', 'username', 'first_name', 'last_name')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
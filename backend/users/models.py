@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 from core.constants import EMAIL_LENGTH, MAX_FIO_LENGTH, USERNAME_LENGTH
+from core.mixins import CounterFieldsMixin
 from core.validators import username_validator
 
 
@@ -42,7 +43,7 @@ class CustomUserManager(UserManager):
         return self.create_user(email, username, password, **extra_fields)
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     """Модель пользователя с дополнительными полями."""
 
     email = models.EmailField('Почта', unique=True, max_length=EMAIL_LENGTH)
@@ -60,10 +61,28 @@ class User(AbstractUser):
         blank=True,
         null=True
     )
+    avatar_variants = models.JSONField(
+        'Варианты аватара',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
 
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     objects = CustomUserManager()
 
     class Meta: